@@ -1,9 +1,15 @@
 import os
-import json
+import math
+import mmap
+import time
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 from pathlib import Path
 import yaml
 import numpy as np
+import pyarrow as pa
 import lancedb
+import torch
 from sentence_transformers import SentenceTransformer
 from src.utils.config_loader import load_config, get_project_root
 
@@ -16,16 +22,31 @@ BATCH_SIZE = int(cfg["dataset"]["batch_size"])
 DB_DIR = project_root / cfg["vector_store"]["db_dir"]
 TABLE = cfg["vector_store"]["table_name"]
 MODEL_NAME = cfg["vector_store"]["embedding_model"]
+ENCODE_BATCH_SIZE = 256
+COMPILE_ENCODER = bool(cfg["vector_store"].get("compile_encoder", False))
+# Below this many rows an exact flat scan is fast enough and exact
+ANN_MIN_ROWS = int(cfg["vector_store"].get("ann_min_rows", 50_000))
 
 
 
 def stream_jsonl(path: Path):
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            yield json.loads(line)
+    # mmap the file and walk line boundaries with mm.find (a C-level memchr), so memory
+    # stays flat; orjson then parses each UTF-8 byte slice directly, with no text decoding
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            start = 0
+            while start < size:
+                end = mm.find(b"\n", start)
+                if end < 0:
+                    end = size
+                line = mm[start:end].strip()
+                start = end + 1
+                if not line:
+                    continue
+                yield orjson.loads(line)
 
 
 def main():
@@ -35,67 +56,136 @@ def main():
     DB_DIR.mkdir(parents=True, exist_ok=True)
 
     model = SentenceTransformer(MODEL_NAME)
+    if torch.cuda.is_available():
+        # fp16 halves GPU memory and roughly doubles encoder throughput
+        model = model.to("cuda").half()
+        if COMPILE_ENCODER and hasattr(torch.nn.Module, "compile"):
+            # dynamic=True: batches are padded to their longest abstract, so sequence
+            # length varies per batch. Warm up with full batches of a few lengths.
+            # Compile in place: on sentence-transformers 6.x auto_model is a read-only alias
+            # whose reassignment is silently ignored by forward()
+            model[0].auto_model.compile(mode="default", dynamic=True)
+            with torch.inference_mode():
+                for n in (32, 128, 256):
+                    model.encode(["warmup " * n] * ENCODE_BATCH_SIZE, batch_size=ENCODE_BATCH_SIZE, show_progress_bar=False)
     db = lancedb.connect(str(DB_DIR))
 
-    # Clean rebuild for now (simple + deterministic)
+    # Clean rebuild for now (simple; doc_idx follows the order of abstracts.jsonl)
     try:
         db.drop_table(TABLE)
     except Exception:
         pass
 
     table = None
-    batch = []
+    # Single writer thread: batch N is written to LanceDB while batch N+1 is encoded
+    writer = ThreadPoolExecutor(max_workers=1)
+    pending = None
+    doc_idxs = []
+    ids = []
+    titles = []
+    abstracts = []
     doc_idx = 0
     kept = 0
     skipped = 0
 
     def flush():
-        nonlocal table, batch, kept
-        if not batch:
+        nonlocal table, kept, pending
+        if not abstracts:
             return
 
-        texts = [r["abstract"] for r in batch]
-        vecs = model.encode(texts, normalize_embeddings=True)
-        vecs = vecs.astype(np.float32)
-
-        for r, v in zip(batch, vecs):
-            r["vector"] = v
+        # encode() already length-sorts its inputs into batches and restores input order
+        with torch.inference_mode():
+            vecs = model.encode(
+                abstracts,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                batch_size=ENCODE_BATCH_SIZE,
+                show_progress_bar=False,
+            )
+        # LanceDB stores float32 vectors; cast only at the Arrow boundary
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        dim = vecs.shape[1]
+
+        # Build one columnar batch; avoids LanceDB re-converting dicts row by row
+        rb = pa.RecordBatch.from_arrays(
+            [
+                pa.array(doc_idxs, type=pa.int32()),
+                pa.array(ids, type=pa.string()),
+                pa.array(titles, type=pa.string()),
+                pa.array(abstracts, type=pa.string()),
+                pa.FixedSizeListArray.from_arrays(pa.array(vecs.reshape(-1)), dim),
+            ],
+            names=["doc_idx", "id", "title", "abstract", "vector"],
+        )
 
         if table is None:
-            table = db.create_table(TABLE, data=batch)
+            table = db.create_table(TABLE, data=rb, mode="overwrite")
         else:
-            table.add(batch)
-
-        kept += len(batch)
-        batch = []
+            # Keep at most one write in flight (also surfaces writer errors)
+            if pending is not None:
+                pending.result()
+            pending = writer.submit(table.add, rb)
+
+        kept += len(abstracts)
+        # Clear in place so the bound append methods in the ingest loop stay valid
+        doc_idxs.clear()
+        ids.clear()
+        titles.clear()
+        abstracts.clear()
+
+    # Hot loop: pre-bind lookups as locals and append straight into the column buffers
+    get = dict.get
+    _strip = str.strip
+    add_doc_idx = doc_idxs.append
+    add_id = ids.append
+    add_title = titles.append
+    add_abstract = abstracts.append
 
     for rec in stream_jsonl(DATA_PATH):
-        rid = str(rec.get("id", "")).strip()
-        title = str(rec.get("title", "")).strip()
-        abstract = str(rec.get("abstract", "")).strip()
+        rid = _strip(str(get(rec, "id", "")))
+        title = _strip(str(get(rec, "title", "")))
+        abstract = _strip(str(get(rec, "abstract", "")))
 
         if not rid or not title or not abstract:
             skipped += 1
             continue
 
-        batch.append(
-            {
-                "doc_idx": doc_idx,
-                "id": rid,
-                "title": title,
-                "abstract": abstract,
-            }
-        )
+        add_doc_idx(doc_idx)
+        add_id(rid)
+        add_title(title)
+        add_abstract(abstract)
         doc_idx += 1
 
-        if len(batch) >= BATCH_SIZE:
+        if len(abstracts) >= BATCH_SIZE:
             flush()
 
     flush()
+    if pending is not None:
+        pending.result()
+    writer.shutdown()
 
     if table is None:
         raise RuntimeError("No valid documents were indexed.")
 
+    # BTREE index on doc_idx: Retriever fetches survivor rows with `doc_idx IN (...)`,
+    # which would otherwise be a filtered scan over the whole table on every query
+    table.create_scalar_index("doc_idx")
+
+    if kept > ANN_MIN_ROWS:
+        # IVF_PQ: queries probe a few of ~sqrt(N) partitions and scan 8-bit PQ codes
+        # (one byte per 8 dims) instead of raw float32 vectors; refine_factor re-ranks
+        # with the exact vectors at query time.
+        # l2 matches the default search metric; on normalized vectors it ranks like cosine.
+        dim = table.schema.field("vector").type.list_size
+        t0 = time.perf_counter()
+        table.create_index(
+            metric="l2",
+            num_partitions=int(math.sqrt(kept)),
+            num_sub_vectors=dim // 8,
+            vector_column_name="vector",
+        )
+        print(f"Built IVF_PQ index over {kept} vectors in {time.perf_counter() - t0:.1f}s")
+
     print(f"Indexed {kept} documents into {DB_DIR} / table '{TABLE}' (skipped {skipped})")
 
 
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
 import os
+import re
 from typing import List, Dict
 
 from src.utils.config_loader import load_config
-from src.rag.prompting import build_messages
+from src.rag.prompting import SYSTEM_PROMPT, build_messages
+
+# "Sources used:" followed by at least one [..] citation, found in a single linear scan
+_COMPLIANT = re.compile(r"Sources used:[^\[]*\[[^\]]+\]")
 
 
 class AnswerGenerator:
@@ -31,13 +35,17 @@ class AnswerGenerator:
         # --- backend init ---
         if self.provider == "ollama":
             # OpenAI-compatible server (Ollama)
+            import httpx
             from openai import OpenAI
 
             base_url = os.getenv("LLM_BASE_URL", llm.get("base_url", "http://localhost:11434/v1"))
             api_key = llm.get("api_key", "ollama")
             model = os.getenv("LLM_MODEL", llm.get("model", "qwen2.5:7b-instruct"))
 
-            self.client = OpenAI(base_url=base_url, api_key=api_key)
+            # Same shape as the SDK default (600 s read, 5 s connect): local generation
+            # can be slow, but an unreachable host should still fail fast
+            timeout = httpx.Timeout(float(llm.get("request_timeout_seconds", 600)), connect=5.0)
+            self.client = OpenAI(base_url=base_url, api_key=api_key, timeout=timeout)
             self.model = model
             self._backend = "ollama"
 
@@ -74,14 +82,28 @@ class AnswerGenerator:
             )
             self._backend = "llama_cpp"
 
+            # llama-cpp-python already reuses the longest token prefix shared with the
+            # previous eval, so requests after the first skip the system block anyway.
+            # Evaluating it here just moves the first request's system prefill to startup.
+            sys_prefix = self._messages_to_prompt([{"role": "system", "content": SYSTEM_PROMPT}])
+            sys_prefix = sys_prefix[: sys_prefix.rindex("### Assistant")]
+            sys_tokens = self.llama.tokenize(sys_prefix.encode("utf-8"), special=True)
+            self.llama.eval(sys_tokens)
+
         else:
             raise ValueError(f"Unsupported llm.provider='{self.provider}'. Use 'ollama' or 'llama_cpp'.")
 
+    def close(self) -> None:
+        """
+        Release backend resources (the ollama client's connection pool).
+        """
+        if self._backend == "ollama":
+            self.client.close()
+
     @staticmethod
     def _is_compliant(text: str) -> bool:
         # minimal check: citations + Sources used line
-        t = (text or "")
-        return ("Sources used:" in t) and ("[" in t and "]" in t)
+        return bool(_COMPLIANT.search(text or ""))
 
     @staticmethod
     def _messages_to_prompt(messages: List[Dict[str, str]]) -> str:
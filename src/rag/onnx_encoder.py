@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Pooling modes in the order sentence-transformers' Pooling module concatenates them
+_POOLING_MODES = ("cls_token", "max_tokens", "mean_tokens", "mean_sqrt_len_tokens", "lasttoken")
+
+
+class OnnxEncoder:
+    """
+    CPU sentence encoder running an ONNX export of a sentence-transformers model
+    through ONNX Runtime.
+
+    Mirrors the subset of `SentenceTransformer.encode` used in this project, so it can
+    be swapped in for `Retriever.model` (vector_store.encoder_backend: "onnx").
+    Tokenization uses the Rust `tokenizers` library; pooling and L2
+    normalization are done in numpy.
+
+    The model is exported with optimum on first use and cached under `onnx_dir`.
+    Inputs are truncated to the model's own `max_seq_length` (from its
+    sentence_bert_config.json) unless `max_length` is given, and pooled with the
+    modes from its Pooling module config.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        onnx_dir: Path,
+        max_length: Optional[int] = None,
+        num_threads: Optional[int] = None,
+    ):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except Exception as e:
+            raise RuntimeError(
+                "onnxruntime and tokenizers are required for encoder_backend=onnx. "
+                "Install them or switch vector_store.encoder_backend back to 'sentence_transformers'."
+            ) from e
+
+        self.model_name = model_name
+        self.model_dir = Path(onnx_dir) / model_name.replace("/", "__")
+        model_path = self.model_dir / "model.onnx"
+        if not model_path.exists():
+            self._export(model_name, self.model_dir)
+
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+        if max_length is None:
+            max_length = self._max_seq_length(model_name, self.model_dir)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.pooling_modes = self._pooling_modes(model_name, self.model_dir)
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.intra_op_num_threads = int(num_threads or os.cpu_count() or 1)
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options=opts, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def _export(model_name: str, out_dir: Path) -> None:
+        try:
+            from optimum.exporters.onnx import main_export
+        except Exception as e:
+            raise RuntimeError(
+                f"ONNX model not found in {out_dir} and optimum is not installed to export it."
+            ) from e
+
+        out_dir.mkdir(parents=True, exist_ok=True)
+        main_export(model_name, output=out_dir, task="feature-extraction")
+
+    @staticmethod
+    def _st_config(model_name: str, model_dir: Path, rel_path: str) -> Optional[dict]:
+        """
+        Load a sentence-transformers config file (e.g. sentence_bert_config.json) for
+        `model_name`: from the export dir, else from a local model dir or the Hub,
+        copying it next to the export on first lookup. Returns None if unavailable.
+        """
+        cached = model_dir / rel_path
+        if not cached.exists():
+            local = Path(model_name) / rel_path
+            try:
+                if local.exists():
+                    src = local
+                else:
+                    from huggingface_hub import hf_hub_download
+
+                    src = Path(hf_hub_download(model_name, rel_path))
+                cached.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(src, cached)
+            except Exception as e:
+                logger.warning("Could not fetch %s for %s: %s", rel_path, model_name, e)
+                return None
+        return json.loads(cached.read_text(encoding="utf-8"))
+
+    @classmethod
+    def _max_seq_length(cls, model_name: str, model_dir: Path) -> int:
+        """
+        Same truncation length SentenceTransformer uses: `max_seq_length` from the
+        model's sentence_bert_config.json, falling back to the tokenizer's
+        `model_max_length`.
+        """
+        st_cfg = cls._st_config(model_name, model_dir, "sentence_bert_config.json") or {}
+        if st_cfg.get("max_seq_length"):
+            return int(st_cfg["max_seq_length"])
+
+        max_len = 512
+        tok_cfg = model_dir / "tokenizer_config.json"
+        if tok_cfg.exists():
+            tok_max = json.loads(tok_cfg.read_text(encoding="utf-8")).get("model_max_length")
+            # HF uses a huge sentinel when the limit is unset
+            if tok_max and int(tok_max) < 100_000:
+                max_len = int(tok_max)
+        logger.warning(
+            "No max_seq_length found for %s; truncating at %d tokens, which may not match "
+            "SentenceTransformer (pass max_length to override)", model_name, max_len
+        )
+        return max_len
+
+    @classmethod
+    def _pooling_modes(cls, model_name: str, model_dir: Path) -> List[str]:
+        """
+        Pooling modes enabled in the model's Pooling module config (path taken from
+        modules.json, usually 1_Pooling/config.json). Fails on modes not implemented here.
+        """
+        pooling_path = "1_Pooling"
+        for module in cls._st_config(model_name, model_dir, "modules.json") or ():
+            if module.get("type", "").endswith("Pooling"):
+                pooling_path = module["path"]
+                break
+
+        pool_cfg = cls._st_config(model_name, model_dir, f"{pooling_path}/config.json")
+        if pool_cfg is None:
+            # SentenceTransformer also defaults to mean pooling for plain HF models
+            logger.warning("No Pooling config found for %s; using mean pooling", model_name)
+            return ["mean_tokens"]
+
+        enabled = [
+            k[len("pooling_mode_"):] for k, v in pool_cfg.items() if k.startswith("pooling_mode_") and v
+        ]
+        unsupported = [m for m in enabled if m not in _POOLING_MODES]
+        if unsupported or not enabled:
+            raise ValueError(
+                f"Unsupported pooling config for {model_name}: {pool_cfg}. "
+                "Use encoder_backend 'sentence_transformers' for this model."
+            )
+        return [m for m in _POOLING_MODES if m in enabled]
+
+    @staticmethod
+    def _pool(token_embs: np.ndarray, attention_mask: np.ndarray, modes: List[str]) -> np.ndarray:
+        """Numpy port of the sentence-transformers Pooling module (right-padded inputs)."""
+        mask = attention_mask[..., None].astype(np.float32)
+        parts: List[np.ndarray] = []
+        for mode in modes:
+            if mode == "cls_token":
+                parts.append(token_embs[:, 0])
+            elif mode == "max_tokens":
+                parts.append(np.where(mask > 0, token_embs, -1e9).max(axis=1))
+            elif mode in ("mean_tokens", "mean_sqrt_len_tokens"):
+                summed = (token_embs * mask).sum(axis=1)
+                counts = np.clip(mask.sum(axis=1), 1e-9, None)
+                parts.append(summed / (counts if mode == "mean_tokens" else np.sqrt(counts)))
+            elif mode == "lasttoken":
+                last = attention_mask.sum(axis=1) - 1
+                parts.append(token_embs[np.arange(len(last)), last])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts, axis=1)
+
+    def encode(
+        self,
+        sentences: Sequence[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+    ) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+
+        out: List[np.ndarray] = []
+        for start in range(0, len(sentences), batch_size):
+            encs = self.tokenizer.encode_batch(list(sentences[start : start + batch_size]))
+            input_ids = np.asarray([e.ids for e in encs], dtype=np.int64)
+            attention_mask = np.asarray([e.attention_mask for e in encs], dtype=np.int64)
+
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self._input_names:
+                feeds["token_type_ids"] = np.asarray([e.type_ids for e in encs], dtype=np.int64)
+
+            token_embs = self.session.run(None, feeds)[0]
+
+            vecs = self._pool(token_embs, attention_mask, self.pooling_modes)
+
+            if normalize_embeddings:
+                vecs = vecs / np.clip(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12, None)
+            out.append(vecs.astype(np.float32))
+
+        if not out:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(out, axis=0)
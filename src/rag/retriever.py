@@ -1,12 +1,64 @@
 from __future__ import annotations
+import functools
+import os
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
 import lancedb
+import torch
 from sentence_transformers import SentenceTransformer, CrossEncoder
 import re
 from src.utils.config_loader import load_config, get_project_root
 
+RERANK_BATCH_SIZE = 64
+RERANK_CHARS_PER_TOKEN = 4
+
+# Opt-in invariant checks on the query path (RAG_DEBUG=1)
+_DEBUG_CHECKS = os.getenv("RAG_DEBUG", "") == "1"
+
+_SENT = re.compile(r"(?<=[.!?])\s+")
+
+# Process-wide model cache keyed by (model_name, device, variant), so Retriever
+# instances in the same process share weights instead of loading their own copy.
+_MODEL_CACHE: Dict[tuple, Any] = {}
+
+
+def _device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _get_encoder(model_name: str, compile_encoder: bool) -> SentenceTransformer:
+    device = _device()
+    compiled = compile_encoder and device == "cuda" and hasattr(torch.nn.Module, "compile")
+    key = (model_name, device, "fp32-compiled" if compiled else "fp32")
+    model = _MODEL_CACHE.get(key)
+    if model is None:
+        model = SentenceTransformer(model_name, device=device)
+        if compiled:
+            # dynamic=True: queries are padded to their own length, so every new length
+            # would otherwise recompile (and CUDA-graph capture per shape). Warm up with
+            # single queries of a few lengths, which is what retrieve() sends.
+            # Compile in place: on sentence-transformers 6.x auto_model is a read-only alias
+            # whose reassignment is silently ignored by forward()
+            model[0].auto_model.compile(mode="default", dynamic=True)
+            with torch.inference_mode():
+                for n in (4, 16, 48):
+                    model.encode(["warmup " * n], show_progress_bar=False)
+        _MODEL_CACHE[key] = model
+    return model
+
+
+def _get_reranker(model_name: str, max_length: int) -> CrossEncoder:
+    device = _device()
+    key = (model_name, device, "fp16" if device == "cuda" else "fp32", max_length)
+    reranker = _MODEL_CACHE.get(key)
+    if reranker is None:
+        reranker = CrossEncoder(model_name, max_length=max_length, device=device)
+        if device == "cuda":
+            reranker.model.half()
+        _MODEL_CACHE[key] = reranker
+    return reranker
+
 
 @dataclass(frozen=True)
 class RetrievedDoc:
@@ -27,12 +79,13 @@ def truncate_by_sentences(text: str, max_chars: int) -> str:
     """
     Truncate text by full sentences without exceeding max_chars.
     """
-    text = re.sub(r"\s+", " ", text).strip()
+    # str.split() collapses whitespace in a C loop, no regex needed
+    text = " ".join(text.split())
 
     if len(text) <= max_chars:
         return text
 
-    sentences = re.split(r"(?<=[.!?])\s+", text)
+    sentences = _SENT.split(text)
 
     out = []
     total = 0
@@ -44,20 +97,25 @@ def truncate_by_sentences(text: str, max_chars: int) -> str:
 
     return " ".join(out).rstrip() + " …"
 
-def _format_context(docs, max_chars: int) -> str:
-    chunks = []
+def _build_context(docs, max_abs: int, max_total: int) -> str:
+    """
+    Truncate abstracts and format DOC blocks in one pass, stopping as soon as
+    the `max_total` character budget is exhausted.
+    """
+    parts: List[str] = []
     total = 0
     for d in docs:
+        abstract = truncate_by_sentences(d.abstract, max_abs)
         block = (
             f"DOC [{d.doc_id}]\n"
             f"Title: {d.title}\n"
-            f"Abstract: {d.abstract}\n"
+            f"Abstract: {abstract}\n"
         )
-        if total + len(block) > max_chars:
+        if total + len(block) > max_total:
             break
-        chunks.append(block)
+        parts.append(block)
         total += len(block)
-    return "\n---\n".join(chunks)
+    return "\n---\n".join(parts)
 
 class Retriever:
     def __init__(self):
@@ -74,34 +132,189 @@ class Retriever:
         self.max_context_chars = int(vs["max_context_chars"])
         self.max_abs_chars = int(vs["max_abstract_chars_per_doc"])
 
+        # ANN (IVF_PQ) search knobs; ignored by LanceDB when the table has no index
+        self.nprobes = int(vs.get("ann_nprobes", 16))
+        self.refine_factor = int(vs.get("ann_refine_factor", 4))
+
         # reranker config
         self.use_reranker = bool(vs["use_reranker"])
         self.reranker_model_name = vs["reranker_model"]
         self.reranker_max_length = int(vs["reranker_max_length"])
 
-        self.model = SentenceTransformer(self.model_name)
+        # Query encoder backend: "sentence_transformers" (default) or "onnx" for CPU deployments
+        self.encoder_backend = str(vs.get("encoder_backend", "sentence_transformers")).strip().lower()
+        if self.encoder_backend == "onnx":
+            from src.rag.onnx_encoder import OnnxEncoder
+
+            self.model = OnnxEncoder(
+                self.model_name,
+                onnx_dir=self.project_root / vs.get("onnx_dir", "data/models/onnx"),
+                num_threads=vs.get("onnx_num_threads"),
+            )
+        elif self.encoder_backend == "sentence_transformers":
+            self.model = _get_encoder(self.model_name, bool(vs.get("compile_encoder", False)))
+        else:
+            raise ValueError(
+                f"Unsupported vector_store.encoder_backend='{self.encoder_backend}'. "
+                "Use 'sentence_transformers' or 'onnx'."
+            )
         self.db = lancedb.connect(str(self.db_dir))
         self.table = self.db.open_table(self.table_name)
 
         self.reranker = None
         if self.use_reranker:
-            self.reranker = CrossEncoder(self.reranker_model_name, max_length=self.reranker_max_length)
+            self.reranker = _get_reranker(self.reranker_model_name, self.reranker_max_length)
+
+        # Per-instance LRU of query vectors; repeat queries skip the encoder forward pass
+        self._qcache = functools.lru_cache(maxsize=1024)(self._embed_query)
+
+    def _embed_query(self, q: str) -> np.ndarray:
+        with torch.inference_mode():
+            qv = self.model.encode([q], normalize_embeddings=True, convert_to_numpy=True)
+        qv = qv.astype(np.float32)[0]
+        # Cached vectors are shared between calls; guard against in-place mutation
+        qv.setflags(write=False)
+        return qv
+
+    def _search_dedup_by_id(
+        self, qv: np.ndarray, initial_k: int, keep: Optional[int] = None
+    ) -> List[RetrievedDoc]:
+        """
+        Vector search that keeps the best-distance row per paper id.
+        Dedup runs on the narrow (doc_idx, id, _distance) columns first, so titles and
+        abstracts are only fetched for the surviving rows (the nearest `keep`, if given).
+        """
+        hits = (
+            self.table.search(qv)
+            .nprobes(self.nprobes)
+            .refine_factor(self.refine_factor)
+            .limit(initial_k)
+            .select(["doc_idx", "id", "_distance"])
+            .to_arrow()
+            .sort_by("_distance")
+        )
+
+        # Sorted by distance, so the first row seen for an id is its best one
+        best: Dict[str, int] = {}
+        distance_by_idx: Dict[int, float] = {}
+        for doc_idx, doc_id, dist in zip(
+            hits.column("doc_idx").to_pylist(),
+            hits.column("id").to_pylist(),
+            hits.column("_distance").to_pylist(),
+        ):
+            if doc_id not in best:
+                best[doc_id] = doc_idx
+                distance_by_idx[doc_idx] = dist
+
+        if not best:
+            return []
 
-    def _dedup_by_id_keep_best_distance(self, docs: List[RetrievedDoc]) -> List[RetrievedDoc]:
-        best: dict[str, RetrievedDoc] = {}
-        for d in docs:
-            prev = best.get(d.doc_id)
-            if prev is None or d.distance < prev.distance:
-                best[d.doc_id] = d
-        return list(best.values())
+        if keep is not None:
+            # dicts keep insertion (= distance) order
+            distance_by_idx = dict(list(distance_by_idx.items())[:keep])
+
+        # doc_idx is unique per row, so filtering on it fetches exactly the survivors;
+        # build_index puts a scalar (BTREE) index on it, so this is an index lookup, not a scan
+        kept_idx = ",".join(str(int(i)) for i in distance_by_idx)
+        tbl = (
+            self.table.search()
+            .where(f"doc_idx IN ({kept_idx})")
+            .select(["doc_idx", "id", "title", "abstract"])
+            .limit(len(distance_by_idx))
+            .to_arrow()
+        )
+
+        # Read whole columns at once instead of building a dict per row
+        docs = [
+            RetrievedDoc(
+                doc_idx=doc_idx,
+                doc_id=doc_id,
+                title=title,
+                abstract=abstract,
+                distance=float(distance_by_idx[doc_idx]),
+            )
+            for doc_idx, doc_id, title, abstract in zip(
+                tbl.column("doc_idx").to_pylist(),
+                tbl.column("id").to_pylist(),
+                tbl.column("title").to_pylist(),
+                tbl.column("abstract").to_pylist(),
+            )
+        ]
+        docs.sort(key=lambda d: d.distance)
+        return docs
+
+    def _predict_pipelined(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """
+        CrossEncoder scoring on CUDA with CPU/GPU overlap: batch i+1 is tokenized
+        into pinned memory and copied with non_blocking=True while batch i runs.
+        Equivalent to `self.reranker.predict(pairs)` for the default activation.
+        """
+        tokenizer = self.reranker.tokenizer
+        model = self.reranker.model
+        device = model.device
+        # attribute name differs across sentence-transformers versions
+        # (v4+: activation_fn; earlier: default_activation_function, Sigmoid for 1 label)
+        activation = (
+            getattr(self.reranker, "activation_fn", None)
+            or getattr(self.reranker, "default_activation_function", None)
+            or getattr(self.reranker, "activation_fct", None)
+            or torch.nn.Identity()
+        )
+
+        def to_device(batch: List[Tuple[str, str]]) -> Dict[str, torch.Tensor]:
+            feats = tokenizer(
+                [q for q, _ in batch],
+                [p for _, p in batch],
+                padding=True,
+                truncation="longest_first",
+                max_length=self.reranker_max_length,
+                return_tensors="pt",
+            )
+            return {name: t.pin_memory().to(device, non_blocking=True) for name, t in feats.items()}
+
+        batches = [pairs[i : i + RERANK_BATCH_SIZE] for i in range(0, len(pairs), RERANK_BATCH_SIZE)]
+        outs: List[torch.Tensor] = []
+        with torch.inference_mode():
+            nxt = to_device(batches[0])
+            for i in range(len(batches)):
+                cur = nxt
+                logits = model(**cur).logits  # launched asynchronously on the GPU
+                if i + 1 < len(batches):
+                    nxt = to_device(batches[i + 1])
+                outs.append(activation(logits))
+            scores = torch.cat(outs).float().cpu().numpy()
+
+        if scores.ndim == 2 and scores.shape[1] == 1:
+            scores = scores[:, 0]
+        return scores
 
     def _rerank(self, query: str, docs: List[RetrievedDoc]) -> List[RetrievedDoc]:
         if not self.reranker or not docs:
             return docs
 
-        pairs = [(f"Question: {query}", f"Paper title: {d.title}\nPaper abstract: {d.abstract}") for d in docs]
+        # Clip abstracts to roughly reranker_max_length tokens (~4 chars/token) up front,
+        # instead of paying to build and tokenize text the CrossEncoder truncates anyway
+        max_abs = self.reranker_max_length * RERANK_CHARS_PER_TOKEN
+        pairs = [
+            (f"Question: {query}", f"Paper title: {d.title}\nPaper abstract: {d.abstract[:max_abs]}")
+            for d in docs
+        ]
 
-        scores = self.reranker.predict(pairs)
+        if torch.cuda.is_available():
+            # Our own batching here: length-sort so each batch pads to similar lengths,
+            # then scatter scores back to input order
+            idx = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+            scores_sorted = self._predict_pipelined([pairs[i] for i in idx])
+            scores = np.empty_like(scores_sorted)
+            scores[idx] = scores_sorted
+        else:
+            # CrossEncoder.predict already length-sorts its batches internally
+            scores = self.reranker.predict(
+                pairs,
+                batch_size=RERANK_BATCH_SIZE,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
 
         rescored = [
             RetrievedDoc(
@@ -122,47 +335,28 @@ class Retriever:
         k = self.top_k if k is None else int(k)
         initial_k = max(self.initial_k, k)
 
-        qv = self.model.encode([query], normalize_embeddings=True).astype(np.float32)[0]
-
-        rows = (
-            self.table.search(qv)
-            .limit(initial_k)
-            .select(["doc_idx", "id", "title", "abstract", "_distance"])
-            .to_list()
-        )
-
-        candidates: List[RetrievedDoc] = []
-        for r in rows:
-            candidates.append(
-                RetrievedDoc(
-                    doc_idx=int(r["doc_idx"]),
-                    doc_id=str(r["id"]),
-                    title=str(r["title"]),
-                    abstract=truncate_by_sentences(str(r["abstract"]), self.max_abs_chars),
-                    distance=float(r["_distance"]),
-                )
-            )
+        qv = self._qcache(query.strip())
 
-        candidates = self._dedup_by_id_keep_best_distance(candidates)
+        # Without a reranker the distance order is final, so only k abstracts are needed
+        candidates = self._search_dedup_by_id(qv, initial_k, keep=None if self.reranker else k)
 
         ranked = self._rerank(query, candidates)
         final_docs = ranked[:k]
 
-        citations = []
-        seen = set()
-        for d in final_docs:
-            if d.doc_id in seen:
-                continue
-            seen.add(d.doc_id)
-            citations.append({
-                "id": d.doc_id,
-                "title": d.title,
-                "distance": d.distance,
-                "rerank_score": d.rerank_score
-            })
+        # Ids are already unique (deduped in _search_dedup_by_id)
+        if _DEBUG_CHECKS:
+            assert len({d.doc_id for d in final_docs}) == len(final_docs), "duplicate doc ids after dedup"
+
+        citations = [
+            {"id": d.doc_id, "title": d.title, "distance": d.distance, "rerank_score": d.rerank_score}
+            for d in final_docs
+        ]
+
+        # Only the docs that make it into the context get their abstracts truncated
+        context = _build_context(final_docs, self.max_abs_chars, self.max_context_chars)
 
         return {
-            "retrieved_context": _format_context(final_docs, self.max_context_chars),
+            "retrieved_context": context,
             "citations": citations,
             "ranked": ranked,
         }
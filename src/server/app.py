@@ -1,51 +1,85 @@
 from __future__ import annotations
 
-import os
-from typing import Any, List, Set, Dict, Optional
+from typing import AbstractSet, Any, List, Set, Dict, Optional
 import re
 
-from fastapi import FastAPI, HTTPException
-from fastapi.concurrency import run_in_threadpool
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
+import anyio.to_thread
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse, ORJSONResponse
+from pydantic import BaseModel, field_validator
 
 from src.server.startup import lifespan
 from src.rag.retriever import Retriever
 from src.rag.generator import AnswerGenerator
 
-CITATION_RE = re.compile(r"\[(\d{4}\.\d{5}v\d+)\]")  # e.g. [2510.02964v1]
-DOC_SPLIT_RE = re.compile(r"\n---\n")               # matches your _format_context separator
-DOC_ID_RE = re.compile(r"^DOC\s+\[(.*?)\]\s*$", re.MULTILINE)
+# All regexes are compiled once here and used via their bound methods
+# (DOC_BLOCK_RE.finditer(s), not re.finditer(pattern, s)), which skips the
+# re module's per-call pattern-cache lookup. Keep new patterns in this block.
+# One DOC block from _build_context: header id + body up to the next "\n---\n" separator
+DOC_BLOCK_RE = re.compile(
+    r"^DOC\s+\[(?P<id>[^\]]+)\](?P<body>.*?)(?=\n---\n|\Z)",
+    re.MULTILINE | re.DOTALL,
+)
 app = FastAPI(title="Research Assistant - Aviel", lifespan=lifespan)
 
+def _valid_arxiv_id(cand: str) -> bool:
+    # new-style arXiv id: 4 digits, '.', 5 digits, 'v', version digits (e.g. 2510.02964v1)
+    return (
+        len(cand) >= 12
+        and cand[4] == "."
+        and cand[10] == "v"
+        and cand[:4].isdecimal()
+        and cand[5:10].isdecimal()
+        and cand[11:].isdecimal()
+    )
+
 def extract_used_ids(answer: str) -> List[str]:
-    # preserve order, unique
+    # preserve order, unique; hand-rolled scan for "[<arxiv id>]" (no regex engine per call)
     seen: Set[str] = set()
     out: List[str] = []
-    for m in CITATION_RE.finditer(answer or ""):
-        cid = m.group(1)
-        if cid not in seen:
-            seen.add(cid)
-            out.append(cid)
+    s = answer or ""
+    i = s.find("[")
+    while i >= 0:
+        j = s.find("]", i + 1)
+        if j < 0:
+            break
+        cand = s[i + 1 : j]
+        if _valid_arxiv_id(cand):
+            if cand not in seen:
+                seen.add(cand)
+                out.append(cand)
+            i = s.find("[", j + 1)
+        else:
+            # a later '[' before this ']' may still open a valid id (e.g. "[[2510.02964v1]")
+            i = s.find("[", i + 1)
     return out
 
-def filter_citations(all_citations: List[Dict], used_ids: List[str]) -> List[Dict]:
-    used = set(used_ids)
-    return [c for c in all_citations if c.get("doc_id") in used]
+def _to_citation(c: Dict) -> Dict[str, Any]:
+    return {
+        "doc_id": c.get("id"),
+        "title": c.get("title"),
+        "distance": c.get("distance"),
+        "rerank_score": c.get("rerank_score"),
+        "url": c.get("url"),
+    }
 
-def filter_context_by_ids(retrieved_context: str, used_ids: List[str]) -> List[str]:
+def filter_context_by_ids(retrieved_context: str, used_ids: List[str], used_set: AbstractSet[str]) -> List[str]:
     """
     Returns list of DOC blocks matching used_ids, preserving used_ids order when possible.
+    `used_set` is the prebuilt set of `used_ids`, shared with the citation filter.
     """
     if not retrieved_context:
         return []
 
-    blocks = DOC_SPLIT_RE.split(retrieved_context)
+    # single pass: id + block extracted together; only cited blocks are copied out,
+    # and scanning stops once every cited id has been found
     by_id: Dict[str, str] = {}
-    for b in blocks:
-        m = DOC_ID_RE.search(b.strip())
-        if m:
-            by_id[m.group(1)] = b.strip()
+    for m in DOC_BLOCK_RE.finditer(retrieved_context):
+        cid = m.group("id")
+        if cid in used_set:
+            by_id[cid] = m.group(0).rstrip()
+            if len(by_id) >= len(used_set):
+                break
 
     # order by used_ids; keep only those found
     return [by_id[cid] for cid in used_ids if cid in by_id]
@@ -55,19 +89,23 @@ class AnswerRequest(BaseModel):
     top_k: Optional[int] = None
     debug: bool = False
 
+    @field_validator("query")
+    @classmethod
+    def _nonempty(cls, v: str) -> str:
+        # rejected during request parsing (422), before the handler runs
+        v = v.strip()
+        if not v:
+            raise ValueError("Query cannot be empty")
+        return v
 
-@app.get("/", response_class=HTMLResponse)
-def home() -> HTMLResponse:
-    static_path = os.path.join(os.path.dirname(__file__), "static", "index.html")
-    with open(static_path, "r", encoding="utf-8") as f:
-        return HTMLResponse(f.read())
 
+@app.get("/", response_class=HTMLResponse)
+async def home() -> HTMLResponse:
+    return HTMLResponse(app.state.index_html)
 
-@app.post("/answer")
-async def answer(req: AnswerRequest) -> Dict[str, Any]:
-    if not req.query.strip():
-        raise HTTPException(status_code=400, detail="Query cannot be empty")
 
+@app.post("/answer", response_class=ORJSONResponse)
+async def answer(req: AnswerRequest) -> ORJSONResponse:
     retriever: Retriever = app.state.retriever
     generator: AnswerGenerator = app.state.generator
 
@@ -76,27 +114,19 @@ async def answer(req: AnswerRequest) -> Dict[str, Any]:
         ans = generator.generate(req.query, r["retrieved_context"])
         return r, ans
 
-    r, ans = await run_in_threadpool(run_rag)
-
-    all_citations = [
-        {
-            "doc_id": c.get("id"),
-            "title": c.get("title"),
-            "distance": c.get("distance"),
-            "rerank_score": c.get("rerank_score"),
-            "url": c.get("url"),
-        }
-        for c in r.get("citations", [])
-    ]
+    # Runs on anyio's default limiter, sized by server.max_concurrent_rag in lifespan
+    r, ans = await anyio.to_thread.run_sync(run_rag)
 
     used_ids = extract_used_ids(ans)
 
     # If model didn't cite anything, fall back to showing retrieved (debug-friendly)
     if used_ids:
-        citations = filter_citations(all_citations, used_ids)
-        ctx_blocks = filter_context_by_ids(r.get("retrieved_context", ""), used_ids)
+        used_set = frozenset(used_ids)
+        # filter while building: uncited docs never get a response dict
+        citations = [_to_citation(c) for c in r.get("citations", ()) if c.get("id") in used_set]
+        ctx_blocks = filter_context_by_ids(r.get("retrieved_context", ""), used_ids, used_set)
     else:
-        citations = all_citations
+        citations = [_to_citation(c) for c in r.get("citations", ())]
         ctx_blocks = [r.get("retrieved_context", "")] if r.get("retrieved_context") else []
 
     payload: Dict[str, Any] = {
@@ -109,4 +139,6 @@ async def answer(req: AnswerRequest) -> Dict[str, Any]:
     if req.debug:
         payload["debug"] = {"query": req.query, "top_k": req.top_k}
 
-    return payload
+    # Serialize with orjson directly (payload is plain str-keyed dicts/lists/floats),
+    # skipping jsonable_encoder + stdlib json
+    return ORJSONResponse(payload)
@@ -1,20 +1,30 @@
 from __future__ import annotations
 
 from contextlib import asynccontextmanager
+from pathlib import Path
+import anyio.to_thread
 from fastapi import FastAPI
 
 from src.rag.retriever import Retriever
 from src.rag.generator import AnswerGenerator
+from src.utils.config_loader import load_config
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Cap concurrent threadpool work (RAG calls) explicitly instead of anyio's default of 40
+    server_cfg = load_config().get("server", {})
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(server_cfg.get("max_concurrent_rag", 40))
+
     retriever = Retriever()
     generator = AnswerGenerator()
     app.state.retriever = retriever
     app.state.generator = generator
+    # Static homepage is read once and served from memory
+    app.state.index_html = Path(__file__).parent.joinpath("static", "index.html").read_text(encoding="utf-8")
 
     try:
         yield
     finally:
-        pass
+        generator.close()
@@ -1,9 +1,14 @@
+import functools
 from pathlib import Path
 from typing import Dict, Any
 import os
 import yaml
 
-_CONFIG: Dict[str, Any] | None = None
+# libyaml-backed loader when available (much faster than the pure-Python one)
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
 
 # Project root = repo root (works locally + in Docker)
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
@@ -16,48 +21,54 @@ def get_project_root() -> Path:
     return PROJECT_ROOT
 
 
-def load_config(filename: str = "config.yml") -> Dict[str, Any]:
+@functools.lru_cache(maxsize=8)
+def _load(path_str: str, mtime_ns: int) -> Dict[str, Any]:
     """
-    Load YAML config with optional environment overrides.
+    Parse the YAML file at `path_str` and apply environment overrides.
+    Cached per (path, mtime), so an edited file is re-parsed on the next call.
     """
-    global _CONFIG
-    if _CONFIG is None:
+    with Path(path_str).open("r", encoding="utf-8") as f:
+        cfg = yaml.load(f, Loader=_Loader)
 
-        # Allow Docker / CLI override of config location
-        config_path = Path(
-            os.getenv("CONFIG_PATH", PROJECT_ROOT / "config" / filename)
+    # -------------------------------
+    # Environment overrides (Docker-friendly)
+    # -------------------------------
+    # Vector DB
+    if "vector_store" in cfg:
+        cfg["vector_store"]["db_dir"] = os.getenv(
+            "LANCEDB_DIR",
+            cfg["vector_store"].get("db_dir")
         )
 
-        if not config_path.exists():
-            raise FileNotFoundError(f"Config file not found at: {config_path}")
+    # LLM (llama.cpp)
+    if "llm" in cfg:
+        cfg["llm"]["model_path"] = os.getenv(
+            "MODEL_PATH",
+            cfg["llm"].get("model_path")
+        )
 
-        with config_path.open("r", encoding="utf-8") as f:
-            cfg = yaml.safe_load(f)
+        # Optional tuning via env
+        if "N_THREADS" in os.environ:
+            cfg["llm"]["n_threads"] = int(os.environ["N_THREADS"])
 
-        # -------------------------------
-        # Environment overrides (Docker-friendly)
-        # -------------------------------
-        # Vector DB
-        if "vector_store" in cfg:
-            cfg["vector_store"]["db_dir"] = os.getenv(
-                "LANCEDB_DIR",
-                cfg["vector_store"].get("db_dir")
-            )
+        if "N_CTX" in os.environ:
+            cfg["llm"]["n_ctx"] = int(os.environ["N_CTX"])
 
-        # LLM (llama.cpp)
-        if "llm" in cfg:
-            cfg["llm"]["model_path"] = os.getenv(
-                "MODEL_PATH",
-                cfg["llm"].get("model_path")
-            )
+    return cfg
 
-            # Optional tuning via env
-            if "N_THREADS" in os.environ:
-                cfg["llm"]["n_threads"] = int(os.environ["N_THREADS"])
 
-            if "N_CTX" in os.environ:
-                cfg["llm"]["n_ctx"] = int(os.environ["N_CTX"])
+def load_config(filename: str = "config.yml") -> Dict[str, Any]:
+    """
+    Load YAML config with optional environment overrides.
+    """
+    # Allow Docker / CLI override of config location
+    config_path = Path(
+        os.getenv("CONFIG_PATH", PROJECT_ROOT / "config" / filename)
+    )
 
-        _CONFIG = cfg
+    try:
+        mtime_ns = config_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Config file not found at: {config_path}") from None
 
-    return _CONFIG
+    return _load(str(config_path), mtime_ns)
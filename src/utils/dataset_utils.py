@@ -1,14 +1,69 @@
 from __future__ import annotations
 
+import heapq
+import queue
+import threading
 import time
-from datetime import datetime
-from typing import Dict, Iterator, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import IO, Dict, Iterator, List, Optional, Tuple
 
-import feedparser
 import requests
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 ARXIV_API_URL = "http://export.arxiv.org/api/query"
 
+# Shared keep-alive session: one TCP connection reused across batches. urllib3 only
+# retries failed connects (nothing reached arXiv); 429/5xx "slow down" responses are
+# retried by _get_feed behind the rate limiter instead of within urllib3's short backoff.
+_SESSION = requests.Session()
+_SESSION.headers.update({"Accept-Encoding": "gzip"})
+_ADAPTER = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.5),
+)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
+
+class _RateLimiter:
+    """
+    Spaces calls at least `min_interval` seconds apart across all threads,
+    keeping the global arXiv request rate bounded when categories run in parallel.
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = float(min_interval)
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Server-side "slow down" / transient statuses retried by _get_feed
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_MAX_ATTEMPTS = 4
+
+_ATOM = "{http://www.w3.org/2005/Atom}"
+_ENTRY = _ATOM + "entry"
+_ID = _ATOM + "id"
+_TITLE = _ATOM + "title"
+_SUMMARY = _ATOM + "summary"
+_PUBLISHED = _ATOM + "published"
+_UPDATED = _ATOM + "updated"
+_AUTHOR = _ATOM + "author"
+_NAME = _ATOM + "name"
+_CATEGORY = _ATOM + "category"
+
 
 def compute_category_targets(cfg: Dict) -> List[Tuple[str, int]]:
     """
@@ -23,75 +78,134 @@ def compute_category_targets(cfg: Dict) -> List[Tuple[str, int]]:
     if total_weight <= 0:
         raise ValueError("Total category weight must be > 0")
 
-    # First, compute proportional allocation
+    # Largest-remainder (Hamilton) apportionment: floor every share, then hand the
+    # leftover seats to the largest fractional remainders (ties -> heavier weight)
     raw_alloc = [max_papers * w / total_weight for w in weights]
-    int_alloc = [max(int(x), 1) for x in raw_alloc]
-
-    # Adjust to match max_papers exactly (or as close as possible)
-    current_total = sum(int_alloc)
-
-    if current_total > max_papers:
-        # Scale down proportionally
-        factor = max_papers / current_total
-        int_alloc = [max(int(n * factor), 1) for n in int_alloc]
-        current_total = sum(int_alloc)
-
-    # If still off due to rounding, fix by adding/subtracting one
-    while current_total < max_papers:
-        # add one to the largest-weight categories first
-        max_idx = max(range(len(int_alloc)), key=lambda i: cats[i]["weight"])
-        int_alloc[max_idx] += 1
-        current_total += 1
-
-    while current_total > max_papers:
-        # subtract one from the smallest-weight categories first (but keep >= 1)
-        min_idx = min(
-            range(len(int_alloc)),
-            key=lambda i: (cats[i]["weight"], int_alloc[i]),
-        )
-        if int_alloc[min_idx] > 1:
-            int_alloc[min_idx] -= 1
-            current_total -= 1
-        else:
-            # can't shrink anymore without going to 0; break
-            break
+    int_alloc = [int(x) for x in raw_alloc]
+    delta = max_papers - sum(int_alloc)
+    by_remainder = sorted(
+        range(len(cats)),
+        key=lambda i: (raw_alloc[i] - int_alloc[i], weights[i], -i),
+        reverse=True,
+    )
+    for i in by_remainder[:delta]:
+        int_alloc[i] += 1
+
+    # Every category gets at least 1; take the seats back from the largest
+    # allocations (never below 1). If max_papers < #categories, the total can exceed it.
+    zeros = [i for i, n in enumerate(int_alloc) if n == 0]
+    if zeros:
+        for i in zeros:
+            int_alloc[i] = 1
+        heap = [(-n, i) for i, n in enumerate(int_alloc) if n > 1]
+        heapq.heapify(heap)
+        for _ in zeros:
+            if not heap:
+                break
+            neg_n, i = heapq.heappop(heap)
+            int_alloc[i] -= 1
+            if -neg_n - 1 > 1:
+                heapq.heappush(heap, (neg_n + 1, i))
 
     targets = [(c["id"], n) for c, n in zip(cats, int_alloc)]
     return targets
 
 
-def _entry_year(entry) -> int | None:
+def _iter_atom_entries(source: IO[bytes]) -> Iterator[Dict]:
+    """
+    Stream <entry> elements from an arXiv Atom feed as plain dicts.
+
+    Uses lxml iterparse on raw bytes and frees each entry once read,
+    so memory stays flat regardless of batch size.
+    """
+    for _, elem in etree.iterparse(source, events=("end",), tag=_ENTRY):
+        entry: Dict = {"authors": [], "tags": []}
+        for child in elem:
+            tag = child.tag
+            if tag == _AUTHOR:
+                entry["authors"].append(child.findtext(_NAME))
+            elif tag == _CATEGORY:
+                entry["tags"].append(child.get("term"))
+            elif tag == _ID:
+                entry["id"] = child.text or ""
+            elif tag == _TITLE:
+                entry["title"] = child.text or ""
+            elif tag == _SUMMARY:
+                entry["summary"] = child.text or ""
+            elif tag == _PUBLISHED:
+                entry["published"] = child.text or ""
+            elif tag == _UPDATED:
+                entry["updated"] = child.text or ""
+
+        yield entry
+
+        # Free the parsed entry and any already-processed siblings
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def _entry_year(entry: Dict) -> int | None:
     """
     Extract publication year from a feed entry.
     """
-    # feedparser gives published_parsed or updated_parsed as a struct_time
-    if hasattr(entry, "published_parsed") and entry.published_parsed:
-        return entry.published_parsed.tm_year
-    if hasattr(entry, "updated_parsed") and entry.updated_parsed:
-        return entry.updated_parsed.tm_year
-    return None
+    # Atom timestamps are ISO 8601, e.g. '2025-01-31T18:59:59Z'
+    ts = entry.get("published") or entry.get("updated")
+    return int(ts[:4]) if ts else None
+
+
+def _get_feed(
+    params: Dict,
+    sleep_seconds: float,
+    rate_limiter: Optional[_RateLimiter],
+) -> requests.Response:
+    """
+    GET one page of the arXiv feed as a streamed response.
+
+    Retries 429/5xx responses with exponential backoff starting at
+    `sleep_seconds` (or the server's Retry-After), and every attempt
+    goes through the shared `rate_limiter`.
+    """
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        resp = _SESSION.get(ARXIV_API_URL, params=params, stream=True, timeout=30)
+        attempt += 1
+        if resp.status_code not in _RETRY_STATUSES or attempt >= _MAX_ATTEMPTS:
+            if resp.status_code >= 400:
+                resp.close()
+                resp.raise_for_status()
+            return resp
+
+        retry_after = resp.headers.get("Retry-After", "")
+        resp.close()
+        delay = sleep_seconds * (2 ** (attempt - 1))
+        if retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        time.sleep(delay)
 
 
 def fetch_papers_for_category(
     cat_id: str,
     limit: int,
-    recent_years: int,
+    cutoff_year: int,
     batch_size: int,
     sleep_seconds: float,
+    rate_limiter: Optional[_RateLimiter] = None,
 ) -> Iterator[Dict]:
     """
     Stream papers from arXiv for a single category.
 
     - Fetches in batches (batch_size) via the arXiv API.
-    - Filters by publication year: only last `recent_years`.
+    - Filters by publication year: only papers from `cutoff_year` onwards.
     - Yields one record (dict) at a time.
+    - With a shared `rate_limiter`, request spacing is global instead of
+      the per-category `sleep_seconds` delay.
     """
     fetched = 0
     start = 0
 
-    current_year = datetime.utcnow().year
-    cutoff_year = current_year - recent_years + 1
-
     while fetched < limit:
         remaining = limit - fetched
         max_results = min(batch_size, remaining)
@@ -103,64 +217,60 @@ def fetch_papers_for_category(
             "sortBy": "submittedDate",
             "sortOrder": "descending",
         }
-
-        resp = requests.get(ARXIV_API_URL, params=params, timeout=30)
-        resp.raise_for_status()
-
-        feed = feedparser.parse(resp.text)
-        entries = feed.entries
-
-        if not entries:
+        # Correctness-critical: the cutoff_year early exit below assumes newest-first
+        # results. Changing the sort would silently scan the whole category feed.
+        assert params["sortBy"] == "submittedDate" and params["sortOrder"] == "descending"
+
+        seen_entries = 0
+        # Stream the body straight into the parser: no buffered copy, no str decode
+        # (lxml picks the encoding up from the XML declaration)
+        with _get_feed(params, sleep_seconds, rate_limiter) as resp:
+            resp.raw.decode_content = True  # transparently gunzip
+
+            for entry in _iter_atom_entries(resp.raw):
+                seen_entries += 1
+                year = _entry_year(entry)
+                if year is not None and year < cutoff_year:
+                    # Since results are sorted by date desc, once we hit older
+                    # than cutoff_year, we can stop for this category.
+                    return
+
+                arxiv_id = entry.get("id", "")
+                # Typical arxiv id form: 'http://arxiv.org/abs/2101.00001v1'
+                _, sep, rest = arxiv_id.rpartition("/abs/")
+                if sep:
+                    arxiv_id = rest
+
+                title = entry.get("title", "").replace("\n", " ").strip()
+                abstract = entry.get("summary", "").replace("\n", " ").strip()
+
+                # _iter_atom_entries already yields plain name/term strings; drop empties in the join
+                authors_str = ", ".join(filter(None, entry.get("authors", ())))
+                categories_str = ", ".join(filter(None, entry.get("tags", ()))) or cat_id
+
+                record = {
+                    "id": arxiv_id,
+                    "title": title,
+                    "authors": authors_str,
+                    "categories": categories_str,
+                    "abstract": abstract,
+                }
+
+                yield record
+                fetched += 1
+                if fetched >= limit:
+                    break
+
+        if not seen_entries:
             # No more results for this category
             break
 
-        for entry in entries:
-            year = _entry_year(entry)
-            if year is not None and year < cutoff_year:
-                # Since results are sorted by date desc, once we hit older
-                # than cutoff_year, we can stop for this category.
-                return
-
-            arxiv_id = entry.get("id", "")
-            # Typical arxiv id form: 'http://arxiv.org/abs/2101.00001v1'
-            if "/abs/" in arxiv_id:
-                arxiv_id = arxiv_id.split("/abs/")[-1]
-
-            title = entry.get("title", "").replace("\n", " ").strip()
-            abstract = entry.get("summary", "").replace("\n", " ").strip()
-
-            authors = []
-            for a in entry.get("authors", []):
-                name = getattr(a, "name", None)
-                if name:
-                    authors.append(name)
-            authors_str = ", ".join(authors)
-
-            categories = []
-            for tag in entry.get("tags", []):
-                term = getattr(tag, "term", None)
-                if term:
-                    categories.append(term)
-            categories_str = ", ".join(categories) if categories else cat_id
-
-            record = {
-                "id": arxiv_id,
-                "title": title,
-                "authors": authors_str,
-                "categories": categories_str,
-                "abstract": abstract,
-            }
-
-            yield record
-            fetched += 1
-            if fetched >= limit:
-                break
-
         # Prepare for next page
         start += max_results
 
         # Polite delay
-        time.sleep(sleep_seconds)
+        if rate_limiter is None:
+            time.sleep(sleep_seconds)
 
 
 def fetch_papers_weighted(cfg: Dict) -> Iterator[Dict]:
@@ -168,32 +278,74 @@ def fetch_papers_weighted(cfg: Dict) -> Iterator[Dict]:
     Orchestrate weighted fetching across all categories.
 
     Uses `compute_category_targets` to decide how many papers
-    to fetch per category.
+    to fetch per category. Categories are fetched by
+    `dataset.fetch_workers` threads (default 1, as arXiv asks for a single
+    connection at a time) behind a shared rate limiter, and records are
+    yielded as they arrive. With more than one worker, their order across
+    categories is not deterministic between runs.
     """
     targets = compute_category_targets(cfg)
     recent_years = cfg["dataset"]["recent_years"]
+    # Computed once for the whole run rather than per category
+    cutoff_year = datetime.now(timezone.utc).year - recent_years + 1
     batch_size = cfg["dataset"]["batch_size"]
-    sleep_seconds = cfg["dataset"]["request_sleep_seconds"]
+    sleep_seconds = float(cfg["dataset"].get("request_sleep_seconds", 3.0))
+    max_workers = int(cfg["dataset"].get("fetch_workers", 1))
 
     total_yielded = 0
     max_papers = cfg["dataset"]["max_papers"]
 
-    for cat_id, target_n in targets:
-        if total_yielded >= max_papers:
-            break
-
-        # Don't exceed global max_papers
-        remaining_global = max_papers - total_yielded
-        target_for_cat = min(target_n, remaining_global)
-
-        for rec in fetch_papers_for_category(
-            cat_id=cat_id,
-            limit=target_for_cat,
-            recent_years=recent_years,
-            batch_size=batch_size,
-            sleep_seconds=sleep_seconds,
-        ):
-            yield rec
+    limiter = _RateLimiter(sleep_seconds)
+    out_q: queue.Queue = queue.Queue(maxsize=batch_size * max_workers)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        # Bounded put that gives up once the consumer has stopped
+        while not stop.is_set():
+            try:
+                out_q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker(cat_id: str, target_n: int) -> None:
+        try:
+            if stop.is_set():
+                return
+            for rec in fetch_papers_for_category(
+                cat_id=cat_id,
+                limit=target_n,
+                cutoff_year=cutoff_year,
+                batch_size=batch_size,
+                sleep_seconds=sleep_seconds,
+                rate_limiter=limiter,
+            ):
+                if not put(rec):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for cat_id, target_n in targets:
+            executor.submit(worker, cat_id, target_n)
+
+        finished = 0
+        while finished < len(targets) and total_yielded < max_papers:
+            item = out_q.get()
+            if item is done:
+                finished += 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+
+            yield item
             total_yielded += 1
-            if total_yielded >= max_papers:
-                break
+    finally:
+        # Don't exceed global max_papers: stop workers and drop unstarted categories
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)